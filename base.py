@@ -49,7 +49,7 @@ class Item(object):
         return cls(name=item_dict["name"])
 
     def to_dict(self):
-        return {}
+        return {"name": self.name}
 
     def __init__(self, name, parent=None, items=None):
         self._name = name
@@ -211,7 +211,53 @@ class ItemTree(SubItem):
 
 
 class Leaf(SubItem):
-    """An item tree leaf"""
+    """An item tree leaf
+
+       A leaf can optionally carry the expected size (in bytes) and SHA-256
+       digest of the file it refers to, so that the data can be verified
+       while it is being downloaded.
+    """
+
+    @classmethod
+    def from_dict(cls, item_dict, parent=None):
+        cls.check_dict_keys(item_dict)
+        return cls(
+            name=item_dict["name"],
+            parent=parent,
+            size=item_dict.get("size"),
+            sha256=item_dict.get("sha256")
+        )
+
+    def __init__(self, name, parent=None, items=None, size=None, sha256=None):
+        SubItem.__init__(self, name=name, parent=parent, items=items)
+        self._size = size
+        self._sha256 = sha256
+
+    @property
+    def size(self):
+        """Expected size of the leaf data in bytes (if known)."""
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self._size = size
+
+    @property
+    def sha256(self):
+        """Expected SHA-256 hex digest of the leaf data (if known)."""
+        return self._sha256
+
+    @sha256.setter
+    def sha256(self, sha256):
+        self._sha256 = sha256
+
+    def to_dict(self):
+        item_dict = super(Leaf, self).to_dict()
+        if self.size is not None:
+            item_dict["size"] = self.size
+        if self.sha256 is not None:
+            item_dict["sha256"] = self.sha256
+        return item_dict
 
     def _get_path(self):
         parent = self.parent
@@ -31,6 +31,21 @@ class BasicTreeConstructionTests(unittest.TestCase):
         leaf = Leaf(name="bar", parent=root)
         self.assertEqual(leaf.name, "bar")
         self.assertEqual(leaf.parent, root)
+        self.assertIsNone(leaf.size)
+        self.assertIsNone(leaf.sha256)
+
+    def leaf_checksum_dict_test(self):
+        """Check that Leaf size and checksum survive a dict round trip"""
+        root = ItemTreeRoot(name="foo")
+        leaf = Leaf(name="bar.tar.gz", parent=root, size=1024, sha256="abcd")
+        leaf_dict = leaf.to_dict()
+        self.assertEqual(leaf_dict, {"name": "bar.tar.gz", "size": 1024, "sha256": "abcd"})
+        new_leaf = Leaf.from_dict(leaf_dict, parent=root)
+        self.assertEqual(new_leaf.name, "bar.tar.gz")
+        self.assertEqual(new_leaf.size, 1024)
+        self.assertEqual(new_leaf.sha256, "abcd")
+        # leafs without checksum metadata don't add any keys
+        self.assertEqual(Leaf(name="baz", parent=root).to_dict(), {"name": "baz"})
 
     def assure_url_prefix_test(self):
         """Check that the url prefix always has a "/"
@@ -0,0 +1,221 @@
+import unittest
+import os
+import io
+import shutil
+import stat
+import tarfile
+import tempfile
+import hashlib
+
+import utils
+from utils import FileObjectWrapper, ProgressHook, SizeMismatch, ChecksumMismatch, download_and_unpack
+
+FILE_CONTENT = b"foo bar baz\n" * 100
+
+def make_tarball(trailing_data=b"", content=FILE_CONTENT, name="foo.txt"):
+    """Return bytes of a small .tar.gz with a single file called name"""
+    tar_buffer = io.BytesIO()
+    tar_file = tarfile.open(fileobj=tar_buffer, mode="w:gz")
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar_file.addfile(info, io.BytesIO(content))
+    tar_file.close()
+    return tar_buffer.getvalue() + trailing_data
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class FakeRequest(io.BytesIO):
+    """A stand-in for the object returned by urllib2.urlopen()"""
+
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.headers = {"content-length": str(len(data))}
+
+
+class FileObjectWrapperTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _extract(self, data, expected_size=None, expected_sha256=None):
+        wrapper = FileObjectWrapper(io.BytesIO(data), ProgressHook(),
+                                    expected_size=expected_size,
+                                    expected_sha256=expected_sha256)
+        tar_file = tarfile.open(mode="r|gz", fileobj=wrapper)
+        tar_file.extractall(path=self.path)
+        tar_file.close()
+        return wrapper
+
+    def matching_size_and_digest_test(self):
+        """Check that matching size and digest pass verification"""
+        data = make_tarball()
+        wrapper = self._extract(data, expected_size=len(data), expected_sha256=sha256(data))
+        wrapper.verify()
+        self.assertEqual(wrapper.read_size, len(data))
+        with open(os.path.join(self.path, "foo.txt"), "rb") as f:
+            self.assertEqual(f.read(), FILE_CONTENT)
+
+    def wrong_digest_test(self):
+        """Check that a wrong digest raises ChecksumMismatch"""
+        data = make_tarball()
+        wrapper = self._extract(data, expected_sha256=sha256(b"something else"))
+        with self.assertRaises(ChecksumMismatch) as cm:
+            wrapper.verify()
+        self.assertEqual(cm.exception.sha256, sha256(data))
+
+    def short_stream_test(self):
+        """Check that a stream shorter than expected fails in verify()"""
+        data = make_tarball()
+        wrapper = self._extract(data, expected_size=len(data) + 1)
+        with self.assertRaises(SizeMismatch) as cm:
+            wrapper.verify()
+        self.assertEqual(cm.exception.size, len(data))
+
+    def overlong_stream_test(self):
+        """Check that a stream longer than expected aborts while reading"""
+        # random content doesn't compress, so the stream is read in many chunks
+        content = os.urandom(256 * 1024)
+        data = make_tarball(content=content)
+        wrapper = FileObjectWrapper(io.BytesIO(data), ProgressHook(), expected_size=16 * 1024)
+        tar_file = tarfile.open(mode="r|gz", fileobj=wrapper)
+        try:
+            with self.assertRaises(SizeMismatch):
+                tar_file.extractall(path=self.path)
+        finally:
+            tar_file.close()
+        # the read was aborted before the whole stream was consumed
+        self.assertLess(wrapper.read_size, len(data))
+        # so only the start of the file has been extracted
+        with open(os.path.join(self.path, "foo.txt"), "rb") as f:
+            extracted = f.read()
+        self.assertLess(len(extracted), len(content))
+        self.assertEqual(extracted, content[:len(extracted)])
+
+    def nothing_to_verify_test(self):
+        """Check that verify() doesn't read trailing data without size or digest"""
+        # more trailing data than the tarfile stream reader buffers
+        data = make_tarball(trailing_data=b"\0" * 256 * 1024)
+        wrapper = self._extract(data)
+        read_size = wrapper.read_size
+        self.assertLess(read_size, len(data))
+        wrapper.verify()
+        self.assertEqual(wrapper.read_size, read_size)
+
+    def upper_case_digest_test(self):
+        """Check that an upper case expected digest is accepted"""
+        data = make_tarball()
+        wrapper = self._extract(data, expected_sha256=sha256(data).upper())
+        wrapper.verify()
+
+    def trailing_data_test(self):
+        """Check that data after the end-of-archive marker is verified"""
+        data = make_tarball(trailing_data=b"\0" * 4096 + b"trailing garbage")
+        wrapper = self._extract(data, expected_size=len(data), expected_sha256=sha256(data))
+        wrapper.verify()
+        self.assertEqual(wrapper.read_size, len(data))
+
+        # the same trailing data must also be covered by the digest
+        wrapper = self._extract(data, expected_sha256=sha256(make_tarball()))
+        with self.assertRaises(ChecksumMismatch):
+            wrapper.verify()
+
+
+class DownloadAndUnpackTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "target")
+        self._urlopen = utils.urllib2.urlopen
+
+    def tearDown(self):
+        utils.urllib2.urlopen = self._urlopen
+        shutil.rmtree(self.temp_dir)
+
+    def _serve(self, data):
+        utils.urllib2.urlopen = lambda url: FakeRequest(data)
+
+    def download_test(self):
+        """Check that a verified download ends up in the target path"""
+        data = make_tarball()
+        self._serve(data)
+        download_and_unpack("https://www.example.com/foo.tar.gz", self.path,
+                            size=len(data), sha256=sha256(data))
+        with open(os.path.join(self.path, "foo.txt"), "rb") as f:
+            self.assertEqual(f.read(), FILE_CONTENT)
+        # no temporary directory is left behind
+        self.assertEqual(os.listdir(self.temp_dir), ["target"])
+
+    def download_path_mode_test(self):
+        """Check that a new target path gets the usual umask based mode"""
+        umask = os.umask(0o022)
+        try:
+            data = make_tarball()
+            self._serve(data)
+            download_and_unpack("https://www.example.com/foo.tar.gz", self.path, sha256=sha256(data))
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o755)
+
+    def download_to_nested_path_test(self):
+        """Check that missing parent directories of the target path are created"""
+        path = os.path.join(self.temp_dir, "a", "b", "target")
+        data = make_tarball()
+        self._serve(data)
+        download_and_unpack("https://www.example.com/foo.tar.gz", path, sha256=sha256(data))
+        with open(os.path.join(path, "foo.txt"), "rb") as f:
+            self.assertEqual(f.read(), FILE_CONTENT)
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir, "a", "b")), ["target"])
+
+    def download_into_existing_path_test(self):
+        """Check that a download replaces existing files in the target path"""
+        os.mkdir(self.path)
+        with open(os.path.join(self.path, "foo.txt"), "wb") as f:
+            f.write(b"old content")
+        with open(os.path.join(self.path, "other.txt"), "wb") as f:
+            f.write(b"other")
+        data = make_tarball()
+        self._serve(data)
+        download_and_unpack("https://www.example.com/foo.tar.gz", self.path, sha256=sha256(data))
+        with open(os.path.join(self.path, "foo.txt"), "rb") as f:
+            self.assertEqual(f.read(), FILE_CONTENT)
+        self.assertEqual(sorted(os.listdir(self.path)), ["foo.txt", "other.txt"])
+        self.assertEqual(os.listdir(self.temp_dir), ["target"])
+
+    def download_merges_directories_test(self):
+        """Check that existing directories in the target path are merged"""
+        os.makedirs(os.path.join(self.path, "dir"))
+        with open(os.path.join(self.path, "dir", "foo.txt"), "wb") as f:
+            f.write(b"old content")
+        with open(os.path.join(self.path, "dir", "other.txt"), "wb") as f:
+            f.write(b"other")
+        data = make_tarball(name="dir/foo.txt")
+        self._serve(data)
+        download_and_unpack("https://www.example.com/foo.tar.gz", self.path, sha256=sha256(data))
+        with open(os.path.join(self.path, "dir", "foo.txt"), "rb") as f:
+            self.assertEqual(f.read(), FILE_CONTENT)
+        with open(os.path.join(self.path, "dir", "other.txt"), "rb") as f:
+            self.assertEqual(f.read(), b"other")
+        self.assertEqual(os.listdir(self.temp_dir), ["target"])
+
+    def download_checksum_mismatch_test(self):
+        """Check that a download with a wrong digest leaves no files behind"""
+        data = make_tarball()
+        self._serve(data)
+        with self.assertRaises(ChecksumMismatch):
+            download_and_unpack("https://www.example.com/foo.tar.gz", self.path,
+                                sha256=sha256(b"something else"))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def download_size_mismatch_test(self):
+        """Check that a short download leaves no files behind"""
+        data = make_tarball()
+        self._serve(data)
+        with self.assertRaises(SizeMismatch):
+            download_and_unpack("https://www.example.com/foo.tar.gz", self.path,
+                                size=len(data) + 1)
+        self.assertEqual(os.listdir(self.temp_dir), [])
@@ -1,5 +1,33 @@
-import urllib2
+import os
+import shutil
 import tarfile
+import hashlib
+import uuid
+
+try:
+  import urllib2  # Python 2
+except ImportError:
+  import urllib.request as urllib2  # Python 3
+
+class SizeMismatch(Exception):
+    """An exception raised when the downloaded data size does not match
+       the expected size.
+    """
+    def __init__(self, expected_size, size):
+        message = "expected %d bytes, got %d bytes" % (expected_size, size)
+        super(SizeMismatch, self).__init__(message)
+        self.expected_size = expected_size
+        self.size = size
+
+class ChecksumMismatch(Exception):
+    """An exception raised when the SHA-256 digest of the downloaded data
+       does not match the expected digest.
+    """
+    def __init__(self, expected_sha256, sha256):
+        message = "expected SHA-256 %s, got %s" % (expected_sha256, sha256)
+        super(ChecksumMismatch, self).__init__(message)
+        self.expected_sha256 = expected_sha256
+        self.sha256 = sha256
 
 class ProgressHook(object):
     def __init__(self):
@@ -36,36 +64,146 @@ class ProgressHook(object):
         pass
 
 class FileObjectWrapper(object):
-    """A file object wrapper used for download progress reporting."""
+    """A file object wrapper used for download progress reporting.
+
+       If an expected size and/or SHA-256 digest is provided the data
+       is also verified as it passes through the wrapper, so that
+       no additional read of the data is needed.
+    """
 
-    def __init__(self, file_object, progress_hook):
+    def __init__(self, file_object, progress_hook, expected_size=None, expected_sha256=None):
         self._file_object = file_object
         self._progress_hook = progress_hook
+        self._expected_size = expected_size
+        self._expected_sha256 = expected_sha256
+        self._read_size = 0
+        if expected_sha256 is not None:
+            self._hash = hashlib.sha256()
+        else:
+            self._hash = None
+
+    @property
+    def read_size(self):
+        """Number of bytes read from the wrapped file object so far."""
+        return self._read_size
 
     def read(self, size=None):
-        if size:  # avoid division by zero
-            self._progress_hook.done_size += size
-            print(self._progress_hook.progress)
-            return self._file_object.read(size)
+        if size:
+            data = self._file_object.read(size)
         else:
-            return self._file_object.read()
+            data = self._file_object.read()
+        self._read_size += len(data)
+        # abort early instead of reading past the expected size
+        if self._expected_size is not None and self._read_size > self._expected_size:
+            raise SizeMismatch(self._expected_size, self._read_size)
+        if self._hash is not None:
+            self._hash.update(data)
+        if data:
+            self._progress_hook.done_size += len(data)
+            print(self._progress_hook.progress)
+        return data
+
+    def verify(self):
+        """Consume any data not read yet and check the size and digest.
+
+        :raises SizeMismatch: if the data size differs from the expected size
+        :raises ChecksumMismatch: if the data digest differs from the expected digest
+        """
+        if self._expected_size is None and self._hash is None:
+            # nothing to verify, don't read any more data
+            return
+        # the tarfile stream reader might stop at the end-of-archive marker,
+        # so hash any trailing data to cover the whole file
+        while self.read(1024*1024):
+            pass
+        if self._expected_size is not None and self._read_size != self._expected_size:
+            raise SizeMismatch(self._expected_size, self._read_size)
+        if self._hash is not None:
+            sha256 = self._hash.hexdigest()
+            if sha256 != self._expected_sha256.lower():
+                raise ChecksumMismatch(self._expected_sha256, sha256)
+
+def _move_contents(src_path, dst_path):
+    """Merge the content of src_path into dst_path and remove src_path.
 
-def download_and_unpack(url, path, progress_hook=None):
+       Like extracting directly to dst_path, directories that already
+       exist are merged recursively, existing files are replaced and
+       anything not present in src_path is kept.
+    """
+    if not os.path.exists(dst_path):
+        os.rename(src_path, dst_path)
+        return
+    for name in os.listdir(src_path):
+        src = os.path.join(src_path, name)
+        dst = os.path.join(dst_path, name)
+        src_is_dir = os.path.isdir(src) and not os.path.islink(src)
+        dst_is_dir = os.path.isdir(dst) and not os.path.islink(dst)
+        if src_is_dir and dst_is_dir:
+            _move_contents(src, dst)
+            continue
+        if dst_is_dir:
+            shutil.rmtree(dst)
+        elif os.path.lexists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+    os.rmdir(src_path)
+
+def download_and_unpack(url, path, progress_hook=None, size=None, sha256=None):
+    """Download a tarball from url and extract it to path.
+
+    If size and/or sha256 are provided (see Leaf.size and Leaf.sha256),
+    the data is verified in a single pass while being extracted.
+    The tarball is extracted to a temporary directory next to path
+    and only merged into path once the data has been verified, so path
+    is left untouched if the download fails. If path already exists,
+    the result is the same as extracting straight into it: existing
+    directories are merged, files from the tarball replace existing
+    files of the same name and all other existing files are kept.
+
+    :raises SizeMismatch: if the downloaded data has an unexpected size
+    :raises ChecksumMismatch: if the downloaded data has an unexpected digest
+    """
     if progress_hook is None:
         # use a fake progress hook if none is provided
         progress_hook = ProgressHook()
+    path = os.path.abspath(path)
     print("opening request")
     request = urllib2.urlopen(url)
-    print("getting request size")
-    request_size = request.headers.get('content-length')
-    if request_size:
-        progress_hook.size = int(request_size)
-    print("wrapping request")
-    request_wrapper = FileObjectWrapper(request, progress_hook)
-    print("opening tarfile")
-    tar_file = tarfile.open(mode="r|gz", fileobj=request_wrapper, bufsize=1024*1024)
-    print("extracting tarfile")
-    tar_file.extractall(path=path)
+    try:
+        print("getting request size")
+        request_size = request.headers.get('content-length')
+        if request_size:
+            progress_hook.size = int(request_size)
+        elif size is not None:
+            progress_hook.size = size
+        print("wrapping request")
+        request_wrapper = FileObjectWrapper(request, progress_hook,
+                                            expected_size=size, expected_sha256=sha256)
+        parent_path = os.path.dirname(path)
+        if not os.path.isdir(parent_path):
+            # extractall() used to create missing parent directories
+            os.makedirs(parent_path)
+        # extract next to path, so that the final move stays on the same filesystem,
+        # os.mkdir() applies the umask like extractall() would for path
+        temp_path = os.path.join(parent_path,
+                                 ".%s.download-%s" % (os.path.basename(path), uuid.uuid4().hex))
+        os.mkdir(temp_path)
+        try:
+            print("opening tarfile")
+            tar_file = tarfile.open(mode="r|gz", fileobj=request_wrapper, bufsize=1024*1024)
+            try:
+                print("extracting tarfile")
+                tar_file.extractall(path=temp_path)
+            finally:
+                tar_file.close()
+            print("verifying download")
+            request_wrapper.verify()
+            _move_contents(temp_path, path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+    finally:
+        request.close()
 
 
 def item_tree_from_folder(path, handle_dirs, handle_files):